@@ -1,8 +1,37 @@
-from east_asian_spacing.builder import *
-from east_asian_spacing.config import *
-from east_asian_spacing.dump import *
-from east_asian_spacing.font import *
-from east_asian_spacing.shaper import *
-from east_asian_spacing.spacing import *
-from east_asian_spacing.tester import *
-from east_asian_spacing.utils import *
+import importlib as _importlib
+
+# Public names are imported from the submodules lazily on the first access,
+# so that commands such as `ttc` do not import all of them.
+_modules = ('builder', 'config', 'dump', 'font', 'shaper', 'spacing', 'tester',
+            'utils')
+
+
+def _import_all():
+    """Imports all public names of `_modules` and defines `__all__`.
+
+    This is the same as `from ... import *` of all `_modules`; i.e., the last
+    one wins."""
+    global __all__
+    names = {}
+    for module_name in _modules:
+        module = _importlib.import_module(f'{__name__}.{module_name}')
+        names.update((name, value) for name, value in vars(module).items()
+                     if not name.startswith('_'))
+    globals().update(names)
+    __all__ = sorted(names.keys() | set(_modules))
+
+
+def __getattr__(name):
+    # `from east_asian_spacing import *` reads `__all__` from here too.
+    if name == '__all__' or not name.startswith('_'):
+        if '__all__' not in globals():
+            _import_all()
+            if name in globals():
+                return globals()[name]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    if '__all__' not in globals():
+        _import_all()
+    return sorted(globals().keys() | set(__all__))
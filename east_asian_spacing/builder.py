@@ -3,6 +3,7 @@ import argparse
 import asyncio
 import contextlib
 import logging
+import os
 import pathlib
 import sys
 import time
@@ -115,10 +116,14 @@ class Builder(object):
 
         # A font collection can share tables. When GPOS is shared in the original
         # font, make sure we add the same data so that the new GPOS is also shared.
+        fonts = self.font.fonts_in_collection
+        coros = (self._config_for_font(font) for font in fonts)
+        configs = await asyncio.gather(*coros)
         spacing_by_offset = {}
         spacings = []
-        for font in self.font.fonts_in_collection:
-            config = await self._config_for_font(font)
+        # Add glyphs in the font order. `GlyphSets.GlyphTypeCache` is shared
+        # across the collection, so results depend on the order.
+        for font, config in zip(fonts, configs):
             if config is None:
                 continue
             reader_offset = font.reader_offset("GPOS")
@@ -154,7 +159,9 @@ class Builder(object):
 
     def _united_spacings(self):
         assert self.has_spacings
-        font = self.font
+        # Most fonts have only one. Use it as is; callers only read it.
+        if len(self._spacings) == 1:
+            return self._spacings[0]
         united_spacing = EastAsianSpacing()
         for spacing in self._spacings:
             united_spacing.unite(spacing)
@@ -168,7 +175,10 @@ class Builder(object):
         if isinstance(output, pathlib.Path):
             if output.is_dir():
                 output = output / f'{font.path.name}-glyphs'
-            with output.open('w') as out_file:
+            # Comments may have non-ASCII characters. Use UTF-8 regardless of
+            # the locale, and a large buffer for fonts with many glyphs.
+            with output.open('w', encoding='utf-8',
+                             buffering=1 << 20) as out_file:
                 self.save_glyphs(out_file, **kwargs)
             return output
 
@@ -193,7 +203,7 @@ class Builder(object):
         assert self.has_spacings
         testers = self._testers(config)
         coros = (tester.test() for tester in testers)
-        await EastAsianSpacingTester.run_coros(coros, parallel=True)
+        await EastAsianSpacingTester.run_coros(coros)
 
     @classmethod
     def expand_paths(cls, paths):
@@ -211,11 +221,21 @@ class Builder(object):
     @classmethod
     def expand_dir(cls, path: pathlib.Path):
         assert path.is_dir()
-        for child in path.iterdir():
-            if child.is_dir():
-                yield from cls.expand_dir(child)
-            elif Font.is_font_extension(child.suffix):
-                yield child
+        # `os.scandir` can tell directories without `stat` on most platforms.
+        is_font_extension = Font.is_font_extension
+        splitext = os.path.splitext
+        dirs = [path]
+        while dirs:
+            with os.scandir(dirs.pop()) as entries:
+                # Read all entries before yielding, to close the directory.
+                font_paths = []
+                for entry in entries:
+                    if entry.is_dir():
+                        dirs.append(pathlib.Path(entry.path))
+                        continue
+                    if is_font_extension(splitext(entry.name)[1]):
+                        font_paths.append(pathlib.Path(entry.path))
+            yield from font_paths
 
     @staticmethod
     async def main():
@@ -235,6 +255,11 @@ class Builder(object):
                             type=int,
                             default=1,
                             help="comment level for the glyph list")
+        parser.add_argument("-j",
+                            "--jobs",
+                            type=int,
+                            help="number of fonts to build concurrently"
+                            " (default: the number of CPUs)")
         parser.add_argument("-l",
                             "--language",
                             help="language if the font is language-specific,"
@@ -274,8 +299,12 @@ class Builder(object):
                 args.glyph_out = sys.stdout
             else:
                 args.glyph_out = pathlib.Path(args.glyph_out)
-                args.glyph_out.mkdir(exist_ok=True, parents=True)
-        for input in Builder.expand_paths(args.inputs):
+        # `glyph_out` is a directory. Create it before the first font is
+        # saved, rather than at the startup.
+        glyph_out_dirs_to_create = ({args.glyph_out} if isinstance(
+            args.glyph_out, pathlib.Path) else set())
+
+        async def build(input):
             font = Font.load(input)
             if font.is_collection:
                 config = Config.for_collection(font,
@@ -292,6 +321,9 @@ class Builder(object):
                 config = config.with_fullwidth_advance(args.em)
 
             builder = Builder(font, config)
+            if glyph_out_dirs_to_create:
+                glyph_out_dirs_to_create.pop().mkdir(exist_ok=True,
+                                                     parents=True)
             output = await builder.build_and_save(
                 args.output,
                 stem_suffix=args.suffix,
@@ -300,10 +332,16 @@ class Builder(object):
                 print_path=args.print_path)
             if not output:
                 logger.info('Skipped saving due to no changes: "%s"', input)
-                continue
+                return
             if args.test:
+                # Test in the same job, because the test keeps the font in
+                # memory. Other jobs can build other fonts while testing.
                 await builder.test(smoke=(args.test == 1))
 
+        coros = (build(input) for input in Builder.expand_paths(args.inputs))
+        jobs = args.jobs or os.cpu_count() or 1
+        await EastAsianSpacingTester.run_coros(coros, limit=jobs)
+
 
 if __name__ == '__main__':
     start_time = time.time()
@@ -1,33 +1,52 @@
-import contextlib
 import copy
 import itertools
 import math
 
+# The default code point sets. `Config` copies them to its own `set`s.
+_cjk_opening = frozenset({
+    0x3008, 0x300A, 0x300C, 0x300E, 0x3010, 0x3014, 0x3016, 0x3018, 0x301A,
+    0x301D, 0xFF08, 0xFF3B, 0xFF5B, 0xFF5F
+})
+_cjk_closing = frozenset({
+    0x3009, 0x300B, 0x300D, 0x300F, 0x3011, 0x3015, 0x3017, 0x3019, 0x301B,
+    0x301E, 0x301F, 0xFF09, 0xFF3D, 0xFF5D, 0xFF60
+})
+_quotes_opening = frozenset({0x2018, 0x201C})
+_quotes_closing = frozenset({0x2019, 0x201D})
+_cjk_middle = frozenset({0x30FB})
+_fullwidth_space = frozenset({0x3000})
+_cjk_period_comma = frozenset({0x3001, 0x3002, 0xFF0C, 0xFF0E})
+_cjk_colon_semicolon = frozenset({0xFF1A, 0xFF1B})
+_cjk_exclam_question = frozenset({0xFF01, 0xFF1F})
+_narrow_opening = frozenset({0x28, 0x5B, 0xFF62})
+_narrow_closing = frozenset({0x29, 0x5D, 0xFF63})
+
+# Indicates a cache miss, because cached results may be `None`.
+_not_cached = object()
+
 
 class Config(object):
 
     def __init__(self):
-        self.cjk_opening = {
-            0x3008, 0x300A, 0x300C, 0x300E, 0x3010, 0x3014, 0x3016, 0x3018,
-            0x301A, 0x301D, 0xFF08, 0xFF3B, 0xFF5B, 0xFF5F
-        }
-        self.cjk_closing = {
-            0x3009, 0x300B, 0x300D, 0x300F, 0x3011, 0x3015, 0x3017, 0x3019,
-            0x301B, 0x301E, 0x301F, 0xFF09, 0xFF3D, 0xFF5D, 0xFF60
-        }
-        self.quotes_opening = {0x2018, 0x201C}
-        self.quotes_closing = {0x2019, 0x201D}
-        self.cjk_middle = {0x30FB}
-        self.fullwidth_space = {0x3000}
-        self.cjk_period_comma = {0x3001, 0x3002, 0xFF0C, 0xFF0E}
-        self.cjk_colon_semicolon = {0xFF1A, 0xFF1B}
-        self.cjk_exclam_question = {0xFF01, 0xFF1F}
+        # `for_font_name` results, keyed by the font name and `is_vertical`.
+        self._config_by_font_name = {}
+
+        # Copy the defaults, so that instances can modify their own sets.
+        self.cjk_opening = set(_cjk_opening)
+        self.cjk_closing = set(_cjk_closing)
+        self.quotes_opening = set(_quotes_opening)
+        self.quotes_closing = set(_quotes_closing)
+        self.cjk_middle = set(_cjk_middle)
+        self.fullwidth_space = set(_fullwidth_space)
+        self.cjk_period_comma = set(_cjk_period_comma)
+        self.cjk_colon_semicolon = set(_cjk_colon_semicolon)
+        self.cjk_exclam_question = set(_cjk_exclam_question)
 
         # Narrow/Halfwidth forms do not have internal spacings,
         # but they can appear in the context.
         # E.g., full-closing should kern if followed by a narrow-closing.
-        self.narrow_opening = {0x28, 0x5B, 0xFF62}
-        self.narrow_closing = {0x29, 0x5D, 0xFF63}
+        self.narrow_opening = set(_narrow_opening)
+        self.narrow_closing = set(_narrow_closing)
 
         # Skip adding the features to fonts with monospace ASCII.
         self.skip_monospace_ascii = False
@@ -46,24 +65,31 @@ class Config(object):
     def for_collection(font, **kwargs):
         return CollectionConfig(font, **kwargs)
 
+    _set_names = ('cjk_opening', 'cjk_closing', 'quotes_opening',
+                  'quotes_closing', 'cjk_middle', 'fullwidth_space',
+                  'cjk_period_comma', 'cjk_colon_semicolon',
+                  'cjk_exclam_question')
+
     @property
-    def _sets(self):
-        yield self.cjk_opening
-        yield self.cjk_closing
-        yield self.quotes_opening
-        yield self.quotes_closing
-        yield self.cjk_middle
-        yield self.fullwidth_space
-        yield self.cjk_period_comma
-        yield self.cjk_colon_semicolon
-        yield self.cjk_exclam_question
+    def code_points(self):
+        """Returns all code points to add the features to."""
+        return frozenset().union(*(getattr(self, name)
+                                   for name in self._set_names))
 
     def clear(self):
-        for set in self._sets:
-            set.clear()
+        for name in self._set_names:
+            getattr(self, name).clear()
+        self.clear_cache()
 
     def clone(self):
-        return copy.deepcopy(self)
+        # Shallow copy, and then copy only the mutable `set` attributes.
+        # This is much cheaper than `copy.deepcopy`.
+        clone = copy.copy(self)
+        clone._config_by_font_name = {}
+        for name, value in vars(clone).items():
+            if isinstance(value, set):
+                setattr(clone, name, set(value))
+        return clone
 
     def clone_if_is(self, other):
         if self is other:
@@ -72,19 +98,37 @@ class Config(object):
 
     def for_font(self, font):
         """Returns a tweaked copy if the `font` needs special treatments.
-        Otherwise returns `self`."""
+        Otherwise returns `self`.
+
+        The `for_font_name` result is cached for each font name. Call
+        `clear_cache()` after modifying attributes that affect the result."""
         # Prefer Typographic Family name (16) if the font has it.
         # Otherwise fallback to Font Family name (1).
         # https://docs.microsoft.com/en-us/typography/opentype/spec/name#name-ids
         name = font.debug_name(16, 1)
         if name:
-            return self.for_font_name(name, font.is_vertical)
+            key = (name, font.is_vertical)
+            config = self._config_by_font_name.get(key, _not_cached)
+            if config is _not_cached:
+                config = self.for_font_name(name, font.is_vertical)
+                self._config_by_font_name[key] = config
+            if config is None or config is self:
+                return config
+            # Return a copy, so that callers can modify it without affecting
+            # the cached one.
+            return config.clone()
         return self
 
+    def clear_cache(self):
+        """Discards the cached `for_font` results."""
+        self._config_by_font_name.clear()
+
+    # Noto has ASCII-mono vaiations. It is intended for code and grid-like
+    # layout that skip adding the features.
+    _skip_monospace_ascii_prefixes = ('Noto ', )
+
     def for_font_name(self, name, is_vertical):
-        # Noto has ASCII-mono vaiations. It is intended for code and grid-like
-        # layout that skip adding the features.
-        if name.startswith('Noto '):
+        if name.startswith(self._skip_monospace_ascii_prefixes):
             return self.with_skip_monospace_ascii(True)
         return self
 
@@ -127,24 +171,25 @@ class Config(object):
         return clone
 
     def remove(self, *codes):
-        for code in codes:
-            for set in self._sets:
-                set.discard(code)
+        for name in self._set_names:
+            getattr(self, name).difference_update(codes)
+        self.clear_cache()
 
     def change_quotes_closing_to_opening(self, *codes):
         """Changes the `code` from `quotes_closing` to `quotes_opening`.
         Does nothing if the `code` is not in `quotes_closing`."""
-        for code in codes:
-            with contextlib.suppress(KeyError):
-                self.quotes_closing.remove(code)
-                self.quotes_opening.add(code)
+        codes = self.quotes_closing.intersection(codes)
+        self.quotes_closing.difference_update(codes)
+        self.quotes_opening.update(codes)
+        self.clear_cache()
 
     @staticmethod
     def _down_sample_to(input, max):
         if len(input) <= max:
             return input
         interval = math.ceil(len(input) / max)
-        return set(itertools.islice(input, 0, None, interval))
+        # Sort, so that the result does not depend on the set order.
+        return set(sorted(input)[::interval])
 
 
 class CollectionConfig(Config):
@@ -3,8 +3,7 @@ import argparse
 import itertools
 import logging
 import pathlib
-from typing import Any
-from typing import Generator
+from typing import Iterator
 from typing import Optional
 from typing import Tuple
 
@@ -23,14 +22,17 @@ class Font(object):
 
     def __init__(self):
         self._byte_array = None
+        self._debug_names = {}
         self.font_index = None
         self._fonts_in_collection = None
         self._fullwidth_advance = None
+        self._glyph_bounds = {}
         self._hbfont = None
         self.horizontal_font = None
         self.is_vertical = False
         self.parent_collection = None
         self._path = None
+        self._shape_results = {}
         self.ttcollection = None
         self._ttfont = None
         self._ttglyphset = None
@@ -54,6 +56,8 @@ class Font(object):
     def _create_vertical_font(self):
         assert not self.is_vertical
         if not self.is_collection and not self.has_gsub_feature("vert"):
+            # Remember that this font has no vertical font.
+            self._vertical_font = False
             return None
         font = self._clone_base()
         # Copy `ttfont` and its derived properties.
@@ -61,7 +65,9 @@ class Font(object):
         font._hbfont = self._hbfont
         font.ttcollection = self.ttcollection
         font._ttfont = self.ttfont
-        self._ttglyphset = self._ttglyphset
+        font._debug_names = self._debug_names
+        font._ttglyphset = self._ttglyphset
+        font._glyph_bounds = self._glyph_bounds
         font._units_per_em = self._units_per_em
         # Setup a vertical font.
         font.is_vertical = True
@@ -113,8 +119,8 @@ class Font(object):
                 yield vertical
         if self.is_collection:
             assert self._fonts_in_collection is not None
-            yield from itertools.chain(*(font.self_and_derived_fonts(
-                create=create) for font in self._fonts_in_collection))
+            for font in self._fonts_in_collection:
+                yield from font.self_and_derived_fonts(create=create)
 
     @property
     def path(self):
@@ -130,6 +136,7 @@ class Font(object):
             font._path = path
             assert font._byte_array is None
             font._hbfont = None
+            font._shape_results = {}
 
     @property
     def fonts_in_collection(self):
@@ -141,6 +148,8 @@ class Font(object):
         if self._vertical_font:
             assert self._vertical_font.is_vertical
             return self._vertical_font
+        if self._vertical_font is False:
+            return None
         return self._create_vertical_font()
 
     def save(self, out_path=None):
@@ -244,16 +253,28 @@ class Font(object):
         self._hbfont = hb.Font(hbface)
         return self._hbfont
 
+    @property
+    def shape_results(self) -> dict:
+        """A cache of shaping results of `hbfont`, for `Shaper` to use.
+        It is cleared when `hbfont` is reloaded."""
+        return self._shape_results
+
     def debug_name(self, *name_ids: int) -> Optional[str]:
         # name_id:
         # https://docs.microsoft.com/en-us/typography/opentype/spec/name#name-id-examples
-        if self.ttfont:
-            name = self.tttable("name")
-            for name_id in name_ids:
-                result = name.getDebugName(name_id)
-                if result:
-                    return result
-        return None
+        if not self.ttfont:
+            return None
+        # This is called for every `__str__`. Cache the results, since
+        # `getDebugName` scans all name records.
+        result = self._debug_names.get(name_ids, False)
+        if result is not False:
+            return result
+        name = self.tttable("name")
+        result = next(
+            filter(None, (name.getDebugName(name_id) for name_id in name_ids)),
+            None)
+        self._debug_names[name_ids] = result
+        return result
 
     def __str__(self):
         name = self.debug_name(4) or self.path.name
@@ -301,19 +322,27 @@ class Font(object):
             return ttfont.getGlyphName(glyph_id)
         return f'glyph{glyph_id:05}'
 
-    def glyph_names(self, glyph_ids) -> Generator[str, Any, None]:
+    def glyph_names(self, glyph_ids) -> Iterator[str]:
         ttfont = self.ttfont
         if ttfont:
-            return (ttfont.getGlyphName(glyph_id) for glyph_id in glyph_ids)
+            # Index the glyph order directly. Glyph IDs from the shaper are
+            # always in range, so `getGlyphName` fallbacks are not needed.
+            glyph_order = ttfont.getGlyphOrder()
+            return map(glyph_order.__getitem__, glyph_ids)
         return (f'glyph{glyph_id:05}' for glyph_id in glyph_ids)
 
     def glyph_bounds(self, glyph) -> Tuple[int]:
-        glyph = self.glyph_name(glyph)
+        # Drawing glyphs is expensive. Cache the bounds by glyph IDs.
+        # The cache is shared with the vertical font.
+        bounds = self._glyph_bounds.get(glyph, False)
+        if bounds is not False:
+            return bounds
         ttglyphset = self.ttglyphset
-        ttglyph = ttglyphset[glyph]
-        bounds = BoundsPen(ttglyphset)
-        ttglyph.draw(bounds)
-        return bounds.bounds
+        ttglyph = ttglyphset[self.glyph_name(glyph)]
+        pen = BoundsPen(ttglyphset)
+        ttglyph.draw(pen)
+        bounds = self._glyph_bounds[glyph] = pen.bounds
+        return bounds
 
     @property
     def script_and_langsys_tags(self, tags=("GSUB", "GPOS")):
@@ -432,8 +461,8 @@ class Font(object):
     def _sort_features_ottable(ottable: otTables.GPOS):
         fontTools.varLib.featureVars.sortFeatureList(ottable)
 
-    _ot_extensions = set(ext.casefold() for ext in ('.otf', '.ttf'))
-    _ttc_extensions = set(ext.casefold() for ext in ('.otc', '.ttc'))
+    _ot_extensions = frozenset(ext.casefold() for ext in ('.otf', '.ttf'))
+    _ttc_extensions = frozenset(ext.casefold() for ext in ('.otc', '.ttc'))
     _font_extensions = _ttc_extensions | _ot_extensions
 
     @staticmethod
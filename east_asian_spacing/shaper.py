@@ -3,13 +3,13 @@ from abc import abstractmethod
 import argparse
 import asyncio
 import enum
-import io
 import itertools
 import json
 import logging
 import os
 import pathlib
 import shlex
+import threading
 from subprocess import CalledProcessError
 from typing import Callable
 from typing import Iterable
@@ -19,12 +19,19 @@ from typing import Optional
 from typing import Union
 from typing import Tuple
 from typing import Set
+import weakref
 
 import uharfbuzz as hb
 
 from east_asian_spacing.font import Font
 import east_asian_spacing.utils as utils
 
+try:
+    # `orjson` is optional. It parses `hb-shape` outputs faster.
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
 logger = logging.getLogger('shaper')
 
 
@@ -32,14 +39,6 @@ def show_dump_images():
     ShaperBase._dump_images = True
 
 
-def _uniq(items):
-    exists = set()
-    for item in items:
-        if item not in exists:
-            exists.add(item)
-            yield item
-
-
 class InkPart(enum.Enum):
     LEFT = enum.auto()
     RIGHT = enum.auto()
@@ -68,20 +67,47 @@ def _compute_ink_part(min, max, left, right):
     assert min <= max
     assert left < right
     margin = InkPartMargin._current
-    middle = (left + right) / 2
-    if max <= middle + margin:
+    # This is called for each glyph. Compare values multiplied by 2 or 4 to
+    # avoid float divisions; e.g., `max * 2 <= left + right + margin * 2` is
+    # `max <= middle + margin`.
+    middle2 = left + right
+    margin2 = margin * 2
+    if max * 2 <= middle2 + margin2:
         return InkPart.LEFT
-    if min >= middle - margin:
+    if min * 2 >= middle2 - margin2:
         return InkPart.RIGHT
-    qleft = (left + middle) / 2
-    qright = (right + middle) / 2
-    if min >= qleft - margin and max <= qright + margin:
+    # `qleft * 4` and `qright * 4`, where `qleft = (left + middle) / 2`.
+    margin4 = margin2 * 2
+    if (min * 4 >= left * 2 + middle2 - margin4
+            and max * 4 <= right * 2 + middle2 + margin4):
         return InkPart.MIDDLE
     return InkPart.OTHER
 
 
+def _compute_ink_parts(glyphs: Iterable['GlyphData'], font) -> None:
+    # Look up the font properties once for all `glyphs`.
+    glyph_bounds = font.glyph_bounds
+    is_vertical = font.is_vertical
+    for glyph in glyphs:
+        glyph.bounds = bounds = glyph_bounds(glyph.glyph_id)
+        if bounds is None:
+            glyph.ink_part = InkPart.OTHER
+        elif is_vertical:
+            offset = glyph.offset
+            glyph.ink_part = _compute_ink_part(offset - bounds[3],
+                                               offset - bounds[1], 0,
+                                               glyph.advance)
+        else:
+            glyph.ink_part = _compute_ink_part(bounds[0], bounds[2], 0,
+                                               glyph.advance)
+
+
 class GlyphData(object):
 
+    # There is an instance for each shaped glyph.
+    __slots__ = ('glyph_id', 'cluster_index', 'advance', 'offset', 'text',
+                 'bounds', 'ink_part')
+
     def __init__(self, glyph_id: int, cluster_index: Optional[int],
                  advance: int, offset: int):
         self.glyph_id = glyph_id
@@ -123,17 +149,7 @@ class GlyphData(object):
         self.cluster_index = None
 
     def compute_ink_part(self, font):
-        self.bounds = bounds = font.glyph_bounds(self.glyph_id)
-        if bounds is None:
-            self.ink_part = InkPart.OTHER
-            return
-        if font.is_vertical:
-            self.ink_part = _compute_ink_part(self.offset - bounds[3],
-                                              self.offset - bounds[1], 0,
-                                              self.advance)
-            return
-        self.ink_part = _compute_ink_part(bounds[0], bounds[2], 0,
-                                          self.advance)
+        _compute_ink_parts((self, ), font)
 
     def get_ink_part(self, font):
         if self.ink_part is None:
@@ -189,15 +205,17 @@ class GlyphDataList(object):
 
     @property
     def glyph_id_set(self) -> Set[int]:
-        return set(self.glyph_ids)
+        return {g.glyph_id for g in self._glyphs}
 
     def isdisjoint(self, other: 'GlyphDataList'):
-        return self.glyph_id_set.isdisjoint(other.glyph_id_set)
+        # `set.isdisjoint` accepts any iterable, and stops at the first match.
+        return self.glyph_id_set.isdisjoint(other.glyph_ids)
 
     def group_by_glyph_id(self) -> Iterator[Tuple[int, 'GlyphDataList']]:
         key_func = lambda g: g.glyph_id
-        glyphs = sorted(self._glyphs, key=key_func)
-        glyphs = _uniq(glyphs)
+        # Remove duplicates before sorting, so that there are fewer to sort.
+        # `dict` keeps the first ones in order, and `sorted` is stable.
+        glyphs = sorted(dict.fromkeys(self._glyphs), key=key_func)
         result = itertools.groupby(glyphs, key=key_func)
         result = map(lambda t: (t[0], GlyphDataList(t[1])), result)
         return result
@@ -208,11 +226,15 @@ class GlyphDataList(object):
     def clear(self):
         self._glyphs.clear()
 
-    def __isub__(self, other: 'GlyphDataList'):
-        assert type(other) is GlyphDataList
-        other_glyph_ids = other.glyph_id_set
-        self._glyphs = list(g for g in self._glyphs
-                            if g.glyph_id not in other_glyph_ids)
+    def __isub__(self, other: Union['GlyphDataList', Set[int]]):
+        if type(other) is GlyphDataList:
+            other_glyph_ids = other.glyph_id_set
+        else:
+            assert isinstance(other, (set, frozenset))
+            other_glyph_ids = other
+        self._glyphs = [
+            g for g in self._glyphs if g.glyph_id not in other_glyph_ids
+        ]
         return self
 
     def __ior__(self, other: Optional[Iterable[GlyphData]]):
@@ -235,14 +257,22 @@ class GlyphDataList(object):
     def ifilter_advance(self,
                         advance: int,
                         non_match: 'GlyphDataList' = None) -> None:
-        self.ifilter(lambda g: g.advance == advance, non_match)
+        # Compare attributes in comprehensions rather than calling a predicate
+        # for each glyph. Same as `ifilter`, an empty `non_match` is not
+        # added to.
+        glyphs = self._glyphs
+        self._glyphs = [g for g in glyphs if g.advance == advance]
+        if non_match:
+            non_match |= (g for g in glyphs if g.advance != advance)
 
     def ifilter_ink_part(self,
                          ink_part: InkPart,
                          non_match: 'GlyphDataList' = None) -> None:
-        for g in self:
-            assert g.ink_part is not None
-        self.ifilter(lambda g: g.ink_part == ink_part, non_match)
+        glyphs = self._glyphs
+        assert all(g.ink_part is not None for g in glyphs)
+        self._glyphs = [g for g in glyphs if g.ink_part == ink_part]
+        if non_match:
+            non_match |= (g for g in glyphs if g.ink_part != ink_part)
 
 
 class ShapeResult(object):
@@ -263,20 +293,19 @@ class ShapeResult(object):
         return self._glyphs[item]
 
     def ifilter(self, predicate):
-        self._glyphs = tuple(filter(predicate, self._glyphs))
+        self._glyphs = tuple(g for g in self._glyphs if predicate(g))
 
     def ifilter_advance(self, advance: int) -> None:
-        self.ifilter(lambda g: g.advance == advance)
+        self._glyphs = tuple(g for g in self._glyphs if g.advance == advance)
 
     def ifilter_missing_glyphs(self):
         # Filter out ".notdef" glyphs. Glyph 0 must be assigned to a .notdef glyph.
         # https://docs.microsoft.com/en-us/typography/opentype/spec/recom#glyph-0-the-notdef-glyph
-        self.ifilter(lambda g: g.glyph_id)
+        self._glyphs = tuple(g for g in self._glyphs if g.glyph_id)
 
     def ifilter_ink_part(self, ink_part):
-        for g in self:
-            assert g.ink_part is not None
-        self.ifilter(lambda g: g.ink_part == ink_part)
+        assert all(g.ink_part is not None for g in self._glyphs)
+        self._glyphs = tuple(g for g in self._glyphs if g.ink_part == ink_part)
 
     @property
     def glyph_ids(self):
@@ -296,8 +325,7 @@ class ShapeResult(object):
             g.clear_cluster_index()
 
     def compute_ink_parts(self, font):
-        for g in self._glyphs:
-            g.compute_ink_part(font)
+        _compute_ink_parts(self._glyphs, font)
 
     def __str__(self):
         return f'[{",".join(str(g) for g in self._glyphs)}]'
@@ -331,6 +359,10 @@ class ShaperBase(object):
         assert False, "Not implemented"
         return ShapeResult()
 
+    async def shape_many(self, texts: Iterable[str]) -> List[ShapeResult]:
+        """Shapes each of `texts`. Subclasses may shape them at once."""
+        return [await self.shape(text) for text in texts]
+
     async def compute_fullwidth_advance(self, text: str = '四水城'):
         """Computes the advance of a "fullwidth" glyph heuristically
         by measuring a few representative glyphs."""
@@ -357,13 +389,47 @@ class ShaperBase(object):
 
 class UHarfBuzzShaper(ShaperBase):
 
+    # Shaping is synchronous, and the results are copied out of the buffer
+    # before the next use. Reuse one buffer for each thread rather than
+    # allocating one for every text.
+    _thread_local = threading.local()
+
     async def shape(self, text):
+        return self._shape(text, self.features_dict)
+
+    async def shape_many(self, texts: Iterable[str]) -> List[ShapeResult]:
+        # Build the features dict only once for all `texts`.
+        features = self.features_dict
+        return [self._shape(text, features) for text in texts]
+
+    def _shape(self, text, features):
         if not text:
             return ShapeResult()
-        buffer = hb.Buffer()
+        # Fonts are shaped with the same texts many times; e.g., to compute
+        # the fullwidth advance, and for each language. Cache the glyph
+        # values on the `font`, and create new `GlyphData` for each call,
+        # because callers modify them.
+        font = self.font
+        key = (text, self.language, self.script,
+               tuple(features.items()) if features else None,
+               tuple(self._shapers) if self._shapers else None)
+        values = font.shape_results.get(key)
+        if values is None:
+            values = font.shape_results[key] = self._shape_values(
+                text, features)
+        result = ShapeResult(GlyphData(*value) for value in values)
+        self._log_result(result, text)
+        return result
+
+    def _shape_values(self, text, features) -> Tuple[Tuple[int, ...], ...]:
+        thread_local = UHarfBuzzShaper._thread_local
+        buffer = getattr(thread_local, 'buffer', None)
+        if buffer is None:
+            buffer = thread_local.buffer = hb.Buffer()
+        else:
+            buffer.clear_contents()
         buffer.add_str(text)
         font = self.font
-        features = self.features_dict
         if font.is_vertical:
             buffer.direction = 'ttb'
             assert features and features['vert']
@@ -391,16 +457,12 @@ class UHarfBuzzShaper(ShaperBase):
         positions = buffer.glyph_positions
         assert len(infos) == len(positions)
         if font.is_vertical:
-            glyphs = (GlyphData(info.codepoint, info.cluster, -pos.y_advance,
-                                -pos.y_offset)
-                      for info, pos in zip(infos, positions))
-        else:
-            glyphs = (GlyphData(info.codepoint, info.cluster, pos.x_advance,
-                                pos.x_offset)
-                      for info, pos in zip(infos, positions))
-        result = ShapeResult(glyphs)
-        self._log_result(result, text)
-        return result
+            return tuple(
+                (info.codepoint, info.cluster, -pos.y_advance, -pos.y_offset)
+                for info, pos in zip(infos, positions))
+        return tuple(
+            (info.codepoint, info.cluster, pos.x_advance, pos.x_offset)
+            for info, pos in zip(infos, positions))
 
 
 class HbShapeShaper(ShaperBase):
@@ -408,23 +470,66 @@ class HbShapeShaper(ShaperBase):
     async def shape(self, text):
         if not text:
             return ShapeResult()
+        args = self._hb_shape_args()
+        self.append_hb_args(text, args)
+        lines = await self._run_hb_shape(args)
+        for line in lines:
+            if line.startswith(b'['):
+                glyphs = _json_loads(line)
+        return await self._result_from_json(glyphs, text)
+
+    async def shape_many(self, texts: Iterable[str]) -> List[ShapeResult]:
+        """Shapes `texts` in one `hb-shape` process.
+
+        `hb-shape` reads the texts from stdin, one per line, and writes one
+        line of the result for each."""
+        texts = list(texts)
+        batch_texts = [text for text in texts if text]
+        if len(batch_texts) <= 1 or any('\n' in t for t in batch_texts):
+            return await super().shape_many(texts)
+        args = self._hb_shape_args()
+        self.append_hb_args(None, args)
+        input = ''.join(f'{text}\n' for text in batch_texts)
+        lines = await self._run_hb_shape(args, input)
+        glyphs_list = [
+            _json_loads(line) for line in lines if line.startswith(b'[')
+        ]
+        assert len(glyphs_list) == len(batch_texts)
+        glyphs_list = iter(glyphs_list)
+        return [
+            await self._result_from_json(next(glyphs_list), text)
+            if text else ShapeResult() for text in texts
+        ]
+
+    def _hb_shape_args(self):
         hb_shape = HbShapeShaper._hb_shape_path or 'hb-shape'
         args = [hb_shape, '--output-format=json', '--no-glyph-names']
-        self.append_hb_args(text, args)
         if utils._log_shaper_logs:
             args.append('--trace')
+        return args
+
+    async def _run_hb_shape(self,
+                            args,
+                            input: Optional[str] = None) -> List[bytes]:
+        """Runs `hb-shape` and returns its output lines. The lines are not
+        decoded, because JSON parsers accept UTF-8 bytes."""
         logger.debug('subprocess.run: %s', shlex.join(args))
-        proc = await asyncio.create_subprocess_exec(
-            *args, stdout=asyncio.subprocess.PIPE)
-        stdout, stderr = await proc.communicate()
+        async with self._semaphore():
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.PIPE if input is not None else None,
+                stdout=asyncio.subprocess.PIPE)
+            stdout, stderr = await proc.communicate(
+                input.encode('utf-8') if input is not None else None)
         if proc.returncode:
-            raise CalledProcessError(proc.returncode, hb_shape, stdout, stderr)
-        with io.StringIO(stdout.decode('utf-8')) as file:
-            for line in file:
-                if utils._log_shaper_logs:
-                    logger.debug('hb-shape: %s', line.rstrip())
-                if line.startswith('['):
-                    glyphs = json.loads(line)
+            raise CalledProcessError(proc.returncode, args[0], stdout, stderr)
+        lines = stdout.splitlines()
+        if utils._log_shaper_logs:
+            for line in lines:
+                logger.debug('hb-shape: %s', line.decode('utf-8'))
+        return lines
+
+    async def _result_from_json(self, glyphs, text):
         logger.debug('glyphs = %s', glyphs)
         if self._dump_images:
             await self.dump(text)
@@ -446,8 +551,27 @@ class HbShapeShaper(ShaperBase):
         # Add '|' so that the height of `hb-view` dump becomes consistent.
         text = f'|{text}|'
         self.append_hb_args(text, args)
-        proc = await asyncio.create_subprocess_exec(*args)
-        await proc.wait()
+        # Skip if the same image was already dumped.
+        key = tuple(args)
+        if key in HbShapeShaper._dumped_args:
+            return
+        HbShapeShaper._dumped_args.add(key)
+        async with self._semaphore():
+            proc = await asyncio.create_subprocess_exec(*args)
+            await proc.wait()
+
+    @staticmethod
+    def _semaphore() -> asyncio.BoundedSemaphore:
+        """Returns a semaphore to limit the number of subprocesses running at
+        the same time, to avoid too many open files."""
+        # Create one for each event loop, because asyncio objects are bound
+        # to the event loop in Python < 3.10.
+        loop = asyncio.get_running_loop()
+        semaphore = HbShapeShaper._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.BoundedSemaphore(HbShapeShaper._max_processes)
+            HbShapeShaper._semaphores[loop] = semaphore
+        return semaphore
 
     def append_hb_args(self, text, args):
         font = self.font
@@ -464,11 +588,17 @@ class HbShapeShaper(ShaperBase):
             args.append(f'--features={",".join(self.features)}')
         if self._shapers:
             args.append(f'--shapers={",".join(self._shapers)}')
+        if text is None:
+            # The text is read from stdin.
+            return
         unicodes = (ord(c) for c in text)
         unicodes_as_hex_string = ','.join(hex(c) for c in unicodes)
         args.append(f'--unicodes={unicodes_as_hex_string}')
 
+    _dumped_args = set()
     _hb_shape_path = None
+    _max_processes = 32
+    _semaphores = weakref.WeakKeyDictionary()
 
 
 def _init_shaper():
@@ -3,7 +3,6 @@ import argparse
 import asyncio
 import itertools
 import logging
-import math
 import sys
 from typing import Iterable
 from typing import List
@@ -66,44 +65,48 @@ class GlyphSets(object):
         else:
             self._root_font = font.root_or_self
 
+    _names = ('left', 'right', 'middle', 'space')
+
     @property
     def _glyph_data_lists(self):
-        return (self.left, self.right, self.middle, self.space)
+        return (getattr(self, name) for name in self._names)
 
     @property
     def _name_and_glyph_data_lists(self):
-        return (('left', self.left), ('right', self.right),
-                ('middle', self.middle), ('space', self.space))
+        return ((name, getattr(self, name)) for name in self._names)
 
     @property
     def glyph_id_set(self) -> Set[int]:
-        glyph_ids = set()
-        for glyph_data_set in self._glyph_data_lists:
-            glyph_ids |= glyph_data_set.glyph_id_set
-        return glyph_ids
+        return {
+            glyph.glyph_id
+            for glyph_data_set in self._glyph_data_lists
+            for glyph in glyph_data_set
+        }
 
     def assert_glyphs_are_disjoint(self):
-        assert self.left.isdisjoint(self.middle)
-        assert self.left.isdisjoint(self.right)
-        assert self.left.isdisjoint(self.space)
-        assert self.middle.isdisjoint(self.right)
-        assert self.middle.isdisjoint(self.space)
-        assert self.right.isdisjoint(self.space)
-        assert self.left.isdisjoint(self.na_left)
-        assert self.right.isdisjoint(self.na_right)
+        assert self._are_glyphs_disjoint(), self._to_str(glyph_ids=True)
+
+    def _are_glyphs_disjoint(self) -> bool:
+        # Build the glyph ID set of each list only once.
+        left, right, middle, space, na_left, na_right = (
+            glyphs.glyph_id_set
+            for glyphs in (self.left, self.right, self.middle, self.space,
+                           self.na_left, self.na_right))
+        return (left.isdisjoint(middle) and left.isdisjoint(right)
+                and left.isdisjoint(space) and middle.isdisjoint(right)
+                and middle.isdisjoint(space) and right.isdisjoint(space)
+                and left.isdisjoint(na_left) and right.isdisjoint(na_right))
 
     def _to_str(self, glyph_ids=False):
-        name_and_glyph_data_lists = self._name_and_glyph_data_lists
-        # Filter out empty glyph sets.
-        name_and_glyph_data_lists = filter(
-            lambda name_and_glyph: name_and_glyph[1],
-            name_and_glyph_data_lists)
+        # Skip empty glyph sets.
         if glyph_ids:
             strs = (f'{name}={sorted(glyphs.glyph_ids)}'
-                    for name, glyphs in name_and_glyph_data_lists)
+                    for name, glyphs in self._name_and_glyph_data_lists
+                    if glyphs)
         else:
             strs = (f'{len(glyphs)}{name[0].upper()}'
-                    for name, glyphs in name_and_glyph_data_lists)
+                    for name, glyphs in self._name_and_glyph_data_lists
+                    if glyphs)
         return ', '.join(strs)
 
     def __str__(self):
@@ -138,9 +141,9 @@ class GlyphSets(object):
         if glyphs_by_glyph_id:
             output.write(f'# {prefix}filtered\n')
             glyph_ids = self.glyph_id_set
-            for glyph_id, glyph_data_list in sorted(
-                    glyphs_by_glyph_id.items(),
-                    key=lambda key_value: key_value[0]):
+            # `group_by_glyph_id` is sorted by glyph IDs, and `dict` keeps the
+            # insertion order.
+            for glyph_id, glyph_data_list in glyphs_by_glyph_id.items():
                 if glyph_id in glyph_ids:
                     continue
                 for glyph_data in glyph_data_list:
@@ -151,13 +154,14 @@ class GlyphSets(object):
     def unite(self, other):
         if not other:
             return
-        self.left |= other.left
-        self.middle |= other.middle
-        self.right |= other.right
-        self.space |= other.space
-        self.na_left |= other.na_left
-        self.na_right |= other.na_right
-        self._all_glyphs |= other._all_glyphs
+        # Most of lists are empty in results of `get_*` methods.
+        if other.left: self.left |= other.left
+        if other.middle: self.middle |= other.middle
+        if other.right: self.right |= other.right
+        if other.space: self.space |= other.space
+        if other.na_left: self.na_left |= other.na_left
+        if other.na_right: self.na_right |= other.na_right
+        if other._all_glyphs: self._all_glyphs |= other._all_glyphs
 
     def add_by_ink_part(self, glyphs: Iterable[GlyphData], font):
         for glyph in glyphs:
@@ -183,15 +187,25 @@ class GlyphSets(object):
         if not config:
             logger.info('Skipped by config: "%s"', font)
             return
+        if not self.has_any_code_points(font, config):
+            logger.info('Skipped because no glyphs to apply: "%s"', font)
+            return
         if not await self.ensure_fullwidth_advance(font, config):
             logger.warning('Skipped because proportional CJK: "%s"', font)
             return
-        results = await asyncio.gather(self.get_opening_closing(font, config),
-                                       self.get_period_comma(font, config),
-                                       self.get_colon_semicolon(font, config),
-                                       self.get_exclam_question(font, config))
+        # Schedule only the getters that can produce glyphs for this font.
+        getters = [self.get_opening_closing]
+        if config.cjk_period_comma:
+            getters.append(self.get_period_comma)
+        if config.cjk_colon_semicolon:
+            getters.append(self.get_colon_semicolon)
+        if not font.is_vertical:
+            getters.append(self.get_exclam_question)
+        results = await asyncio.gather(*(getter(font, config)
+                                         for getter in getters))
         for result in results:
-            self.unite(result)
+            if result is not None:
+                self.unite(result)
         self.ifilter_fullwidth(font)
         self.add_to_cache(font)
         self.assert_glyphs_are_disjoint()
@@ -204,42 +218,65 @@ class GlyphSets(object):
             self._font = font
             self._all_glyphs = glyph_sets._all_glyphs
             self._log_name = log_name
+            # Unified code points (e.g., U+2018-201D) in most fonts are Latin glyphs.
+            # Enable "fwid" feature to get fullwidth glyphs.
+            if font.is_vertical:
+                self._features, self._fullwidth_features = (('vert', ),
+                                                            ('fwid', 'vert'))
+            else:
+                self._features, self._fullwidth_features = ((), ('fwid', ))
+            self._shapers = {}
 
         async def shape(self,
                         unicodes,
                         language=None,
-                        fullwidth=True,
-                        temporary=False) -> GlyphDataList:
-            font = self._font
+                        fullwidth=True) -> GlyphDataList:
             text = ''.join(chr(c) for c in unicodes)
-            # Unified code points (e.g., U+2018-201D) in most fonts are Latin glyphs.
-            features = []
-            # Enable "fwid" feature to get fullwidth glyphs.
-            if fullwidth: features.append('fwid')
-            if font.is_vertical: features.append('vert')
-            shaper = Shaper(font,
-                            language=language,
-                            script='hani',
-                            features=features,
-                            log_name=self._log_name)
-            result = await shaper.shape(text)
+            result = await self._shaper(language, fullwidth).shape(text)
 
             result.set_text(text)
-            if not temporary and self._all_glyphs is not None:
-                self._all_glyphs |= result
+            self._all_glyphs |= result
 
             result.ifilter_missing_glyphs()
             result.clear_cluster_indexes()
-            result.compute_ink_parts(font)
+            result.compute_ink_parts(self._font)
             return GlyphDataList(result)
 
+        def _shaper(self, language, fullwidth) -> Shaper:
+            # Reuse `Shaper` instances for the same language and features.
+            key = (language, fullwidth)
+            shaper = self._shapers.get(key)
+            if shaper is None:
+                shaper = Shaper(self._font,
+                                language=language,
+                                script='hani',
+                                features=(self._fullwidth_features
+                                          if fullwidth else self._features),
+                                log_name=self._log_name)
+                self._shapers[key] = shaper
+            return shaper
+
     async def _shape(self, font, unicodes, language=None) -> GlyphDataList:
-        shaper = GlyphSets._ShapeHelper(self, font)
-        result = await shaper.shape(unicodes,
-                                    language=language,
-                                    temporary=True)
-        result.ifilter_advance(font.fullwidth_advance)
-        return result
+        # Only glyph IDs and advances are needed. Skip setting texts and
+        # computing ink parts that `_ShapeHelper.shape` does.
+        features = ['fwid', 'vert'] if font.is_vertical else ['fwid']
+        shaper = Shaper(font,
+                        language=language,
+                        script='hani',
+                        features=features)
+        result = await shaper.shape(''.join(chr(c) for c in unicodes))
+        # Filter missing glyphs and non-fullwidth glyphs in one pass.
+        em = font.fullwidth_advance
+        return GlyphDataList(g for g in result
+                             if g.glyph_id and g.advance == em)
+
+    @staticmethod
+    def has_any_code_points(font: Font, config: Config) -> bool:
+        """Returns `True` if the `font` has glyphs for any of the code points
+        in the `config`. This is much cheaper than shaping them."""
+        get_nominal_glyph = font.hbfont.get_nominal_glyph
+        return any(
+            get_nominal_glyph(code) is not None for code in config.code_points)
 
     @staticmethod
     async def ensure_fullwidth_advance(font: Font, config: Config) -> bool:
@@ -277,10 +314,12 @@ class GlyphSets(object):
         if font.is_vertical:
             # Left/right in vertical should apply only if they have `vert` glyphs.
             # YuGothic/UDGothic doesn't have 'vert' glyphs for U+2018/201C/301A/301B.
-            horizontal = await self._shape(font.horizontal_font,
-                                           cjk_opening | cjk_closing)
-            trio.left -= horizontal
-            trio.right -= horizontal
+            if trio.left or trio.right:
+                horizontal = await self._shape(font.horizontal_font,
+                                               cjk_opening | cjk_closing)
+                horizontal = horizontal.glyph_id_set
+                trio.left -= horizontal
+                trio.right -= horizontal
         else:
             assert not trio.na_left
             assert not trio.na_right
@@ -304,14 +343,16 @@ class GlyphSets(object):
         shaper = GlyphSets._ShapeHelper(self, font, log_name='period_comma')
         ja, zht = await asyncio.gather(shaper.shape(text, language="JAN"),
                                        shaper.shape(text, language="ZHT"))
-        if not config.use_ink_bounds and ja == zht:
-            if not config.language: font.raise_require_language()
-            if config.language == "ZHT" or config.language == "ZHH":
+        use_ink_bounds = config.use_ink_bounds
+        if not use_ink_bounds and ja == zht:
+            language = config.language
+            if not language: font.raise_require_language()
+            if language in ("ZHT", "ZHH"):
                 ja.clear()
             else:
                 zht.clear()
         trio = GlyphSets(ja, None, zht)
-        if config.use_ink_bounds:
+        if use_ink_bounds:
             trio.left.ifilter_ink_part(InkPart.LEFT)
             trio.right.ifilter_ink_part(InkPart.RIGHT)
             trio.middle.ifilter_ink_part(InkPart.MIDDLE)
@@ -326,15 +367,18 @@ class GlyphSets(object):
         ja, zhs = await asyncio.gather(shaper.shape(text, language="JAN"),
                                        shaper.shape(text, language="ZHS"))
         if config.use_ink_bounds:
-            trio.add_by_ink_part(itertools.chain(ja, zhs), font)
+            # Classify `zhs` only if it is different from `ja`.
+            glyphs = ja if ja == zhs else itertools.chain(ja, zhs)
+            trio.add_by_ink_part(glyphs, font)
         else:
             ja = trio.add_from_cache(font, ja)
             zhs = trio.add_from_cache(font, zhs)
             if not ja and not zhs:
                 return trio
+            language = config.language
             if ja == zhs:
-                if not config.language: font.raise_require_language()
-                if config.language == "ZHS":
+                if not language: font.raise_require_language()
+                if language == "ZHS":
                     ja.clear()
                 else:
                     zhs.clear()
@@ -345,7 +389,7 @@ class GlyphSets(object):
                 # Japanese, they may or may not be upright. Vertical alternate
                 # glyphs indicate they are rotated. In ZHT, they may be upright
                 # even when there are vertical glyphs.
-                if config.language is None or config.language == "JAN":
+                if ja and language in (None, "JAN"):
                     ja_horizontal = await self._shape(font.horizontal_font,
                                                       text,
                                                       language="JAN")
@@ -365,12 +409,14 @@ class GlyphSets(object):
         shaper = GlyphSets._ShapeHelper(self, font, log_name='exclam_question')
         ja, zhs = await asyncio.gather(shaper.shape(text, language="JAN"),
                                        shaper.shape(text, language="ZHS"))
-        if config.use_ink_bounds:
+        use_ink_bounds = config.use_ink_bounds
+        if use_ink_bounds:
             ja.clear()
             zhs.ifilter_ink_part(InkPart.LEFT)
-        if not config.use_ink_bounds and ja == zhs:
-            if not config.language: font.raise_require_language()
-            if config.language == "ZHS":
+        if not use_ink_bounds and ja == zhs:
+            language = config.language
+            if not language: font.raise_require_language()
+            if language == "ZHS":
                 ja.clear()
             else:
                 zhs.clear()
@@ -380,17 +426,33 @@ class GlyphSets(object):
         return result
 
     class GlyphTypeCache(object):
+        # Types are stored in a `bytearray` indexed by glyph IDs, as indices
+        # to `_values`. 0 is for glyphs not in the cache.
+        _values = (None, "L", "M", "R")
+        _index_by_value = {value: i for i, value in enumerate(_values)}
 
         def __init__(self):
-            self.type_by_glyph_id = dict()
+            self.type_by_glyph_id = bytearray()
 
         def add_glyphs(self, glyphs: Iterable[int], value):
+            glyphs = tuple(glyphs)
+            if not glyphs:
+                return
+            index = self._index_by_value[value]
+            type_by_glyph_id = self.type_by_glyph_id
+            size = max(glyphs) + 1
+            if size > len(type_by_glyph_id):
+                type_by_glyph_id.extend(bytes(size - len(type_by_glyph_id)))
+            assert all(type_by_glyph_id[glyph_id] in (0, index)
+                       for glyph_id in glyphs)
             for glyph_id in glyphs:
-                assert self.type_by_glyph_id.get(glyph_id, value) == value
-                self.type_by_glyph_id[glyph_id] = value
+                type_by_glyph_id[glyph_id] = index
 
         def type_from_glyph_id(self, glyph_id):
-            return self.type_by_glyph_id.get(glyph_id, None)
+            type_by_glyph_id = self.type_by_glyph_id
+            if glyph_id < len(type_by_glyph_id):
+                return self._values[type_by_glyph_id[glyph_id]]
+            return None
 
         @staticmethod
         def get(font, create=False):
@@ -412,15 +474,16 @@ class GlyphSets(object):
 
         def add_to_trio(self, glyph_set_trio, glyphs: Iterable[GlyphData]):
             not_cached = GlyphDataList()
-            glyph_set_by_value = {
-                None: not_cached,
-                "L": glyph_set_trio.left,
-                "M": glyph_set_trio.middle,
-                "R": glyph_set_trio.right
-            }
+            # Indexed by the values in `type_by_glyph_id`.
+            add_by_index = (not_cached.add, glyph_set_trio.left.add,
+                            glyph_set_trio.middle.add,
+                            glyph_set_trio.right.add)
+            type_by_glyph_id = self.type_by_glyph_id
+            size = len(type_by_glyph_id)
             for glyph in glyphs:
-                value = self.type_from_glyph_id(glyph.glyph_id)
-                glyph_set_by_value[value].add(glyph)
+                glyph_id = glyph.glyph_id
+                index = type_by_glyph_id[glyph_id] if glyph_id < size else 0
+                add_by_index[index](glyph)
             return not_cached
 
     def add_to_cache(self, font):
@@ -437,19 +500,31 @@ class GlyphSets(object):
 
         def __init__(self, font: Font, glyph_sets: 'GlyphSets') -> None:
             glyph_sets.assert_glyphs_are_disjoint()
-            self.left, self.right, self.middle, self.space, self.na_left, self.na_right = (
-                tuple(font.glyph_names(sorted(glyphs.glyph_id_set)))
+            glyph_id_lists = tuple(
+                sorted(glyphs.glyph_id_set)
                 for glyphs in (glyph_sets.left, glyph_sets.right,
                                glyph_sets.middle, glyph_sets.space,
                                glyph_sets.na_left, glyph_sets.na_right))
+            # Get glyph names in one call, and then split them.
+            glyph_ids = itertools.chain.from_iterable(glyph_id_lists)
+            names = tuple(font.glyph_names(glyph_ids))
+            ends = itertools.accumulate(len(ids) for ids in glyph_id_lists)
+            self.left, self.right, self.middle, self.space, self.na_left, self.na_right = (
+                names[end - len(ids):end]
+                for ids, end in zip(glyph_id_lists, ends))
+            # Glyphs that can follow `left`, and that can precede `right`.
+            self.after_left = (self.left + self.right + self.middle +
+                               self.space + self.na_left)
+            self.before_right = (self.right + self.middle + self.space +
+                                 self.na_right)
 
             em = font.fullwidth_advance
             # When `em` is an odd number, ceil the advance. To do this, use
             # floor to compute the adjustment of the advance and the offset.
             # e.g., "ZCOOL QingKe HuangYou".
-            half_em = math.floor(em / 2)
+            half_em = em // 2
             assert half_em > 0
-            quad_em = math.floor(half_em / 2)
+            quad_em = half_em // 2
             if font.is_vertical:
                 self.left_value = buildValue({"YAdvance": -half_em})
                 self.right_value = buildValue({
@@ -500,21 +575,31 @@ class GlyphSets(object):
         logger.info('Adding Lookups for %dL, %dR, %dM, %dS', len(pos.left),
                     len(pos.right), len(pos.middle), len(pos.space))
 
-        feature_tag = 'vhal' if font.is_vertical else 'halt'
-        if not Font._has_ottable_feature(table, feature_tag):
+        # Collect existing feature tags once, and keep it up to date.
+        feature_tags = set(
+            feature_record.FeatureTag
+            for feature_record in table.FeatureList.FeatureRecord)
+        is_vertical = font.is_vertical
+        feature_tag = 'vhal' if is_vertical else 'halt'
+        if feature_tag not in feature_tags:
             lookup_index = self._build_halt_lookup(font, lookups, pos)
-            self._add_feature(font, table, feature_tag, [lookup_index])
+            self._add_feature(font, table, feature_tags, feature_tag,
+                              [lookup_index])
 
-        feature_tag = 'vchw' if font.is_vertical else 'chws'
+        feature_tag = 'vchw' if is_vertical else 'chws'
         lookup_indices = self._build_chws_lookup(font, lookups, pos)
-        self._add_feature(font, table, feature_tag, lookup_indices)
+        self._add_feature(font, table, feature_tags, feature_tag,
+                          lookup_indices)
         return True
 
-    def _add_feature(self, font: Font, table: otTables.GPOS, feature_tag: str,
+    def _add_feature(self, font: Font, table: otTables.GPOS,
+                     feature_tags: Set[str], feature_tag: str,
                      lookup_indices: List[int]) -> None:
-        logger.debug('Adding "%s" to: "%s" %s', feature_tag, font,
-                     self._to_str(glyph_ids=True))
-        assert not Font._has_ottable_feature(table, feature_tag)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Adding "%s" to: "%s" %s', feature_tag, font,
+                         self._to_str(glyph_ids=True))
+        assert feature_tag not in feature_tags
+        feature_tags.add(feature_tag)
         features = table.FeatureList.FeatureRecord
         feature_index = len(features)
         logger.info('Adding Feature "%s" at index %d for lookup %s',
@@ -574,9 +659,8 @@ class GlyphSets(object):
         # Build lookup for adjusting the left glyph, using type 2 pair positioning.
         ttfont = font.ttfont
         pair_pos_builder = PairPosBuilder(ttfont, None)
-        pair_pos_builder.addClassPair(
-            None, pos.left, pos.left_value,
-            pos.left + pos.right + pos.middle + pos.space + pos.na_left, None)
+        pair_pos_builder.addClassPair(None, pos.left, pos.left_value,
+                                      pos.after_left, None)
         lookup = pair_pos_builder.build()
         assert lookup
         lookup_indices.append(len(lookups))
@@ -591,9 +675,8 @@ class GlyphSets(object):
 
         chain_context_pos_builder = ChainContextPosBuilder(ttfont, None)
         chain_context_pos_builder.rules.append(
-            ChainContextualRule(
-                [pos.right + pos.middle + pos.space + pos.na_right],
-                [pos.right], [], [[single_pos_lookup]]))
+            ChainContextualRule([pos.before_right], [pos.right], [],
+                                [[single_pos_lookup]]))
         lookup = chain_context_pos_builder.build()
         assert lookup
         lookup_indices.append(len(lookups))
@@ -634,10 +717,24 @@ class EastAsianSpacing(object):
 
     async def add_glyphs(self, font, config):
         assert not font.is_vertical
-        await self.horizontal.add_glyphs(font, config)
         vertical_font = font.vertical_font
         if vertical_font:
-            await self.vertical.add_glyphs(vertical_font, config)
+            # The vertical pass reads `fullwidth_advance` of the horizontal
+            # font, which the horizontal pass may compute. Compute it before
+            # running the passes concurrently. Other states, including
+            # `GlyphTypeCache`, are separate for horizontal and vertical
+            # fonts. Fonts in a collection can't run concurrently, because
+            # the results depend on the cache filled by preceding fonts.
+            horizontal_config = config.for_font(font)
+            if (horizontal_config and GlyphSets.has_any_code_points(
+                    font, horizontal_config)):
+                await GlyphSets.ensure_fullwidth_advance(
+                    font, horizontal_config)
+            await asyncio.gather(
+                self.horizontal.add_glyphs(font, config),
+                self.vertical.add_glyphs(vertical_font, config))
+        else:
+            await self.horizontal.add_glyphs(font, config)
         self.from_fonts.append(font)
 
     @staticmethod
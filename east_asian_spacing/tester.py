@@ -1,10 +1,9 @@
 #!/usr/bin/env python3
 import argparse
 import asyncio
-import copy
+import functools
 import itertools
 import logging
-import math
 from typing import Iterable
 from typing import Optional
 from typing import Tuple
@@ -21,12 +20,24 @@ logger = logging.getLogger('test')
 
 class ShapeTest(object):
 
+    # There can be many instances for the product of code points.
+    __slots__ = ('font', 'input', 'text', 'index', 'features', 'off_features',
+                 'fail_reasons', 'off_glyphs', 'glyphs')
+
+    # Features to shape with, without and with the features to test.
+    _off_features = ('fwid', )
+    _features = ('fwid', 'chws')
+    _vertical_off_features = ('fwid', 'vert')
+    _vertical_features = ('fwid', 'vert', 'vchw')
+
     @staticmethod
     def create_list(font: Font, inputs: Iterable[Tuple[int, int]], index: int):
-        off_features = ['fwid']
-        if font.is_vertical: off_features.append('vert')
-        features = copy.copy(off_features)
-        features.append('vchw' if font.is_vertical else 'chws')
+        if font.is_vertical:
+            off_features = ShapeTest._vertical_off_features
+            features = ShapeTest._vertical_features
+        else:
+            off_features = ShapeTest._off_features
+            features = ShapeTest._features
         tests = tuple(
             ShapeTest(font, input, index, features, off_features)
             for input in inputs)
@@ -36,6 +47,7 @@ class ShapeTest(object):
                  features, off_features):
         self.font = font
         self.input = input
+        self.text = ''.join(map(chr, input))
         self.index = index
         self.features = features
         self.off_features = off_features
@@ -43,17 +55,6 @@ class ShapeTest(object):
         self.off_glyphs = None
         self.glyphs = None
 
-    async def shape(self, language):
-        font = self.font
-        shaper = Shaper(font,
-                        language=language,
-                        script='hani',
-                        features=self.off_features)
-        text = ''.join(chr(c) for c in self.input)
-        self.off_glyphs = await shaper.shape(text)
-        shaper.features = self.features
-        self.glyphs = await shaper.shape(text)
-
     @property
     def should_have_offset(self) -> bool:
         return self.index != 0
@@ -63,16 +64,18 @@ class ShapeTest(object):
         # the feature should not apply.
         if em is None:
             em = self.font.fullwidth_advance
-        # Should not apply if any glyphs are missing.
-        if any(g.glyph_id == 0 for g in self.off_glyphs):
-            return False
-        # Should not apply if the advance of the target glyph is not 1em.
-        if self.off_glyphs[self.index].advance != em:
-            return False
-        if glyph_id_sets:
-            for i, glyph_id_set in enumerate(glyph_id_sets):
-                if self.off_glyphs[i].glyph_id not in glyph_id_set:
-                    return False
+        index = self.index
+        num_sets = len(glyph_id_sets) if glyph_id_sets else 0
+        for i, glyph in enumerate(self.off_glyphs):
+            glyph_id = glyph.glyph_id
+            # Should not apply if any glyphs are missing.
+            if glyph_id == 0:
+                return False
+            # Should not apply if the advance of the target glyph is not 1em.
+            if i == index and glyph.advance != em:
+                return False
+            if i < num_sets and glyph_id not in glyph_id_sets[i]:
+                return False
         return True
 
     @property
@@ -102,6 +105,9 @@ class EastAsianSpacingTester(object):
         self.font = font
         self._config = config.for_font(font)
         self._spacing = spacing
+        # Shape results of this font, keyed by the text, the language, and
+        # the features.
+        self._shape_cache = {}
 
     @property
     def _glyph_sets(self) -> Optional[GlyphSets]:
@@ -111,20 +117,42 @@ class EastAsianSpacingTester(object):
             return self._spacing.horizontal
         return None
 
+    class _GlyphIdSets(object):
+
+        def __init__(self, glyph_sets: GlyphSets):
+            self.left = frozenset(glyph_sets.left.glyph_id_set)
+            self.right = frozenset(glyph_sets.right.glyph_id_set)
+            self.right_or_na_right = self.right.union(
+                glyph_sets.na_right.glyph_ids)
+
+    @functools.cached_property
+    def _glyph_id_sets(self) -> Optional[_GlyphIdSets]:
+        glyph_sets = self._glyph_sets
+        if glyph_sets:
+            return EastAsianSpacingTester._GlyphIdSets(glyph_sets)
+        return None
+
+    @functools.cached_property
+    def _trim_advances(self) -> Tuple[int, int, int]:
+        """Returns the fullwidth advance, the expected advance after trimmed,
+        and the expected offset."""
+        # `fullwidth_advance` is settable, so it is cached per tester, not on
+        # the `Font`.
+        em = self.font.fullwidth_advance
+        half_em = (em + 1) // 2
+        return em, half_em, em - half_em
+
     async def test(self, fonts=None):
         fonts = fonts if fonts else (self.font, )
-        fonts = itertools.chain(*(f.self_and_derived_fonts() for f in fonts))
-        fonts = filter(lambda font: not font.is_collection, fonts)
         testers = tuple(
             EastAsianSpacingTester(font, self._config, spacing=self._spacing)
-            for font in fonts)
+            for f in fonts for font in f.self_and_derived_fonts()
+            if not font.is_collection)
         assert all(t.font == self.font
                    or t.font.root_or_self == self.font.root_or_self
                    for t in testers)
         coros = (tester._test() for tester in testers)
-        # Run tests without using `asyncio.gather`
-        # to avoid too many open files when using subprocesses.
-        results = await EastAsianSpacingTester.run_coros(coros, parallel=False)
+        results = await EastAsianSpacingTester.run_coros(coros)
 
         summaries = []
         assert len(testers) == len(results)
@@ -135,8 +163,9 @@ class EastAsianSpacingTester(object):
                 logger.info('PASS: "%s" %d tests', font, len(tests))
                 continue
             summary = f'FAIL: "{font}" {len(failures)}/{len(tests)} tests failed'
-            logger.error('%s:\n%s', summary,
-                         '\n'.join(str(test) for test in failures))
+            if logger.isEnabledFor(logging.ERROR):
+                logger.error('%s:\n%s', summary,
+                             '\n'.join(str(test) for test in failures))
             summaries.append(summary)
         if len(summaries):
             raise AssertionError(
@@ -145,75 +174,116 @@ class EastAsianSpacingTester(object):
         logger.info('All %d fonts paased.', len(testers))
 
     async def _test(self):
-        coros = []
         config = self._config
         if not config:
             return tuple()
 
         font = self.font
-        opening = config.cjk_opening
-        closing = config.cjk_closing
-        glyph_sets = self._glyph_sets
+        # Skip code points the font does not have. Tests with missing glyphs
+        # should not apply, and they are not worth shaping.
+        get_nominal_glyph = font.hbfont.get_nominal_glyph
+        opening, closing = (tuple(code for code in codes
+                                  if get_nominal_glyph(code) is not None)
+                            for codes in (config.cjk_opening,
+                                          config.cjk_closing))
         cl_op_tests = ShapeTest.create_list(
             font, itertools.product(closing, opening), 0)
-        coros.append(
-            self.assert_trim(
-                cl_op_tests,
-                (glyph_sets.left.glyph_id_set,
-                 glyph_sets.right.glyph_id_set) if glyph_sets else None))
-
         op_op_tests = ShapeTest.create_list(
             font, itertools.product(opening, opening), 1)
-        coros.append(
-            self.assert_trim(
-                op_op_tests,
-                (glyph_sets.right.glyph_id_set
-                 | glyph_sets.na_right.glyph_id_set,
-                 glyph_sets.right.glyph_id_set) if glyph_sets else None))
-
-        # Run tests without using `asyncio.gather`
-        # to avoid too many open files when using subprocesses.
-        tests = await EastAsianSpacingTester.run_coros(coros, parallel=False)
-        # Expand to a list of `ShapeTest`.
-        tests = tuple(itertools.chain(*tests))
-        return tests
+        # Shape both lists at once. They have the same features.
+        await self._shape_tests(cl_op_tests + op_op_tests, config.language)
 
-    async def assert_trim(self, tests: Iterable[ShapeTest],
-                          glyph_id_sets: Optional[Tuple[Set[int]]]):
-        font = self.font
-        config = self._config
-        coros = (test.shape(language=config.language) for test in tests)
-        await EastAsianSpacingTester.run_coros(coros)
+        glyph_id_sets = self._glyph_id_sets
+        if glyph_id_sets:
+            cl_op_sets = (glyph_id_sets.left, glyph_id_sets.right)
+            op_op_sets = (glyph_id_sets.right_or_na_right, glyph_id_sets.right)
+        else:
+            cl_op_sets = op_op_sets = None
+        cl_op_tested = self.assert_trim(cl_op_tests, cl_op_sets)
+        op_op_tested = self.assert_trim(op_op_tests, op_op_sets)
+        return tuple(cl_op_tested + op_op_tested)
 
-        em = font.fullwidth_advance
-        half_em = math.ceil(em / 2)
-        offset = em - half_em
+    def assert_trim(self, tests: Iterable[ShapeTest],
+                    glyph_id_sets: Optional[Tuple[Set[int]]]):
+        """Checks the results of shaped `tests`, and returns tested ones."""
+        em, half_em, offset = self._trim_advances
         tested = []
         for test in tests:
-            index = test.index
+            glyphs = test.glyphs
+            off_glyphs = test.off_glyphs
             if not test.should_apply(glyph_id_sets, em=em):
-                if test.glyphs != test.off_glyphs:
+                if glyphs != off_glyphs:
                     test.fail('Unexpected differences')
                     tested.append(test)
                 continue
-            assert test.glyphs
-            assert test.off_glyphs
-            if test.glyphs[index].advance != half_em:
+            assert glyphs
+            assert off_glyphs
+            index = test.index
+            glyph = glyphs[index]
+            if glyph.advance != half_em:
                 test.fail(f'{index}.advance != {half_em}')
-            if (test.should_have_offset and test.glyphs[index].offset -
-                    test.off_glyphs[index].offset != -offset):
+            if (test.should_have_offset
+                    and glyph.offset - off_glyphs[index].offset != -offset):
                 test.fail(f'{index}.offset != {offset}')
             tested.append(test)
         return tested
 
+    async def _shape_tests(self, tests: Iterable[ShapeTest], language):
+        """Shapes `tests` with and without the features.
+
+        All `tests` must have the same features. Texts are shaped in one
+        `Shaper.shape_many` call for each set of features."""
+        tests = tuple(tests)
+        if not tests:
+            return
+        texts = tuple(test.text for test in tests)
+        off_results, results = await asyncio.gather(
+            self._shape_many(texts, language, tests[0].off_features),
+            self._shape_many(texts, language, tests[0].features))
+        for test, off_glyphs, glyphs in zip(tests, off_results, results):
+            test.off_glyphs = off_glyphs
+            test.glyphs = glyphs
+
+    async def _shape_many(self, texts, language, features):
+        # Shape only texts not in the cache.
+        features = tuple(features)
+        cache = self._shape_cache
+        missing = tuple(text for text in dict.fromkeys(texts)
+                        if (text, language, features) not in cache)
+        if missing:
+            shaper = Shaper(self.font,
+                            language=language,
+                            script='hani',
+                            features=features)
+            results = await shaper.shape_many(missing)
+            for text, result in zip(missing, results):
+                cache[(text, language, features)] = result
+        return [cache[(text, language, features)] for text in texts]
+
     @staticmethod
-    async def run_coros(coros, parallel=True):
-        if parallel:
+    async def run_coros(coros,
+                        parallel: bool = True,
+                        limit: Optional[int] = None):
+        """Runs `coros` concurrently, and returns their results in order.
+
+        If `limit` is set, at most `limit` of them run at the same time, and
+        `coros` is iterated lazily as they complete. `parallel=False` is the
+        same as `limit=1`."""
+        if not parallel:
+            limit = 1
+        if not limit:
             return await asyncio.gather(*coros)
-        results = []
-        for coro in coros:
-            results.append(await coro)
-        return results
+        # `limit` workers share one iterator, so that `coros` is not read
+        # until a worker is available.
+        iterator = enumerate(coros)
+        results = {}
+
+        async def run():
+            for index, coro in iterator:
+                results[index] = await coro
+
+        await asyncio.gather(*(run() for _ in range(limit)))
+        return [results[index] for index in range(len(results))]
 
     @staticmethod
     async def main():
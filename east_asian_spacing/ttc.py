@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 import argparse
+import concurrent.futures
 import logging
+import os
 import pathlib
 
+from fontTools.ttLib import TTFont
+from fontTools.ttLib.sfnt import readTTCHeader
 from fontTools.ttLib.ttCollection import TTCollection
 
 from east_asian_spacing.utils import init_logging
@@ -11,15 +15,41 @@ logger = logging.getLogger('ttc')
 
 
 def ttc_split(path: pathlib.Path):
-    ttc = TTCollection(path)
-    for i, ttfont in enumerate(ttc.fonts):
-        if ttfont.has_key('glyf'):
-            ext = '.ttf'
-        else:
-            ext = '.otf'
-        output = path.with_name(f'{path.name}-{i}{ext}')
-        logger.info('%s', output)
-        ttfont.save(output)
+    num_fonts = _num_fonts_in_collection(path)
+    if num_fonts <= 1 or (os.cpu_count() or 1) <= 1:
+        ttc = TTCollection(path, lazy=True)
+        for i, ttfont in enumerate(ttc.fonts):
+            _save_font(path, i, ttfont)
+        return
+
+    # Saving compiles all tables of each font. Do it in parallel processes.
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        for future in [
+                executor.submit(_save_font_at, path, i)
+                for i in range(num_fonts)
+        ]:
+            future.result()
+
+
+def _num_fonts_in_collection(path: pathlib.Path) -> int:
+    with path.open('rb') as file:
+        return readTTCHeader(file).numFonts
+
+
+def _save_font_at(path: pathlib.Path, index: int):
+    # Load lazily, so that each process decompiles only its font.
+    ttfont = TTFont(path, fontNumber=index, lazy=True)
+    _save_font(path, index, ttfont)
+
+
+def _save_font(path: pathlib.Path, index: int, ttfont: TTFont):
+    if ttfont.has_key('glyf'):
+        ext = '.ttf'
+    else:
+        ext = '.otf'
+    output = path.with_name(f'{path.name}-{index}{ext}')
+    logger.info('%s', output)
+    ttfont.save(output)
 
 
 def main():
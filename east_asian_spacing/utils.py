@@ -1,5 +1,6 @@
 import logging
 import pathlib
+import stat
 from typing import Optional
 from typing import Union
 
@@ -62,9 +63,14 @@ def calc_output_path(input_path: pathlib.Path,
     if output_path:
         if not isinstance(output_path, pathlib.Path):
             output_path = pathlib.Path(output_path)
-        if output_path.is_dir():
+        # Check the type with one `stat` call.
+        try:
+            mode = output_path.stat().st_mode
+        except OSError:
+            mode = 0
+        if stat.S_ISDIR(mode):
             output_path = output_path / input_path.name
-        elif output_path.is_file() or is_file:
+        elif stat.S_ISREG(mode) or is_file:
             # `output` is an existing file or a new file.
             pass
         else:
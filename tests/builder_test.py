@@ -28,6 +28,13 @@ def test_expand_paths(monkeypatch):
         assert (result[0] == 'x' and set(result[1:-1]) == fonts_set
                 and result[-1] == 'y'), result
 
+        # Sub-directories are expanded recursively.
+        sub_dir = dir / 'sub'
+        sub_dir.mkdir()
+        sub_font = sub_dir / 'b.otf'
+        sub_font.touch()
+        assert set(call([dir_str])) == fonts_set | {str(sub_font)}
+
     monkeypatch.setattr('sys.stdin', io.StringIO('line1\nline2\n'))
     assert call(['-']) == ['line1', 'line2']
     monkeypatch.setattr('sys.stdin', io.StringIO('line1\nline2\n'))
@@ -47,3 +54,13 @@ async def test_save_to_same_file(test_font_path, tmp_path):
 
     font = Font.load(out_path)
     assert EastAsianSpacing.font_has_feature(font)
+
+
+@pytest.mark.asyncio
+async def test_save_glyph_out_new_file(test_font_path, tmp_path):
+    builder = Builder(test_font_path)
+    glyph_out = tmp_path / 'glyphs.txt'
+    assert not glyph_out.exists()
+    await builder.build_and_save(tmp_path / 'out', glyph_out=glyph_out)
+    # A new `glyph_out` should be written as a file.
+    assert glyph_out.is_file()
@@ -4,6 +4,7 @@ from east_asian_spacing import Builder
 from east_asian_spacing import CollectionConfig
 from east_asian_spacing import Config
 from east_asian_spacing import EastAsianSpacingTester
+from east_asian_spacing import Font
 
 
 @pytest.mark.asyncio
@@ -82,6 +83,40 @@ def test_config_for_font_name():
     assert config.for_font_name('never exists', False) is config
 
 
+def test_config_for_font_cache(test_font_path):
+    font = Font.load(test_font_path)
+
+    class MyCustomConfig(Config):
+
+        def __init__(self, tweak):
+            super().__init__()
+            self.tweak = tweak
+            self.num_calls = 0
+
+        def for_font_name(self, name, is_vertical):
+            self.num_calls += 1
+            if self.tweak:
+                return self.with_skip_monospace_ascii(True)
+            return None
+
+    # `None` results should be cached.
+    config = MyCustomConfig(False)
+    assert config.for_font(font) is None
+    assert config.for_font(font) is None
+    assert config.num_calls == 1
+    config.remove(0x3008)
+    assert config.for_font(font) is None
+    assert config.num_calls == 2
+
+    # Modifying the result should not affect later results.
+    config = MyCustomConfig(True)
+    tweaked = config.for_font(font)
+    assert tweaked.skip_monospace_ascii
+    tweaked.remove(0x3008)
+    assert 0x3008 in config.for_font(font).cjk_opening
+    assert config.num_calls == 1
+
+
 def test_config_for_language():
     config = Config.default
     assert config.use_ink_bounds
@@ -96,3 +131,29 @@ def test_config_for_language():
     # The original `config` should not be modified.
     assert config.use_ink_bounds
     assert not config.language
+
+
+def test_config_with_language_returns_new_copy():
+    config = Config.default.clone()
+    jan = config.for_language('JAN')
+    jan.remove(0x3008)
+    assert 0x3008 not in jan.cjk_opening
+
+    # Modifying a derived config should not affect other derived configs.
+    jan2 = config.for_language('JAN')
+    assert jan2 is not jan
+    assert 0x3008 in jan2.cjk_opening
+    assert 0x3008 in config.cjk_opening
+
+
+def test_config_sets_are_mutable():
+    config = Config.default.clone()
+    config.cjk_opening.add(0x2329)
+    config.cjk_closing.discard(0x3009)
+    assert 0x2329 in config.cjk_opening
+    assert 0x3009 not in config.cjk_closing
+
+    # The default and new instances should not be modified.
+    for other in (Config.default, Config()):
+        assert 0x2329 not in other.cjk_opening
+        assert 0x3009 in other.cjk_closing
@@ -1,6 +1,11 @@
+import asyncio
 import itertools
+import shutil
 
+from east_asian_spacing.shaper import HbShapeShaper
 from east_asian_spacing.shaper import InkPartMargin
+from east_asian_spacing.shaper import ShaperBase
+from east_asian_spacing.shaper import UHarfBuzzShaper
 import pytest
 
 from east_asian_spacing import Font
@@ -69,6 +74,94 @@ async def test_ink_part(test_font_path):
     assert result[3].ink_part == InkPart.OTHER
 
 
+@pytest.mark.asyncio
+async def test_shape_cache(test_font_path):
+    font = Font.load(test_font_path)
+    shaper = Shaper(font)
+    result1 = await shaper.shape('\uFF08\uFF09')
+    result1.compute_ink_parts(font)
+    result2 = await shaper.shape('\uFF08\uFF09')
+    # Modifying a result should not affect other results.
+    assert result1 != result2
+    assert result2[0].ink_part is None
+    assert result1[0] is not result2[0]
+    result2.compute_ink_parts(font)
+    assert result1 == result2
+
+
+@pytest.mark.skipif(
+    not shutil.which(HbShapeShaper._hb_shape_path or 'hb-shape'),
+    reason='hb-shape is not installed')
+@pytest.mark.asyncio
+async def test_hb_shape_shape_many(test_font_path):
+    horizontal_font = Font.load(test_font_path)
+    texts = ('\uFF08\uFF09', '', '\u30FB\u56DB', '\u3000')
+    for font in (horizontal_font, horizontal_font.vertical_font):
+        features = ['fwid', 'vert'] if font.is_vertical else ['fwid']
+        shaper = HbShapeShaper(font, features=features)
+        results = await shaper.shape_many(texts)
+        # `shape_many` shapes all texts in one process. The results should be
+        # the same as shaping them one by one.
+        assert len(results) == len(texts)
+        for text, result in zip(texts, results):
+            assert result == await shaper.shape(text)
+
+
+@pytest.mark.asyncio
+async def test_hb_shape_shape_many_fake(test_font_path, monkeypatch):
+    # Outputs of `hb-shape --output-format=json --no-glyph-names`.
+    outputs = {
+        '\uFF08\uFF09': b'[{"g":1,"cl":0,"dx":0,"dy":0,"ax":1000,"ay":0},'
+        b'{"g":2,"cl":1,"dx":0,"dy":0,"ax":1000,"ay":0}]',
+        '\u30FB': b'[{"g":3,"cl":0,"dx":-20,"dy":-880,"ax":1000,'
+        b'"ay":-1000}]',
+    }
+    inputs = []
+
+    class FakeProcess(object):
+        returncode = 0
+
+        async def communicate(self, input=None):
+            inputs.append(input)
+            texts = input.decode('utf-8').splitlines()
+            return b'\n'.join(outputs[text] for text in texts) + b'\n', None
+
+    async def create_subprocess_exec(*args, **kwargs):
+        assert args[0].endswith('hb-shape')
+        return FakeProcess()
+
+    monkeypatch.setattr(asyncio, 'create_subprocess_exec',
+                        create_subprocess_exec)
+    horizontal_font = Font.load(test_font_path)
+    texts = ('\uFF08\uFF09', '', '\u30FB')
+    shaper = HbShapeShaper(horizontal_font)
+    results = await shaper.shape_many(texts)
+    # All non-empty texts should be shaped in one process.
+    assert inputs == ['\uFF08\uFF09\n\u30FB\n'.encode('utf-8')]
+    assert results == [
+        ShapeResult([GlyphData(1, 0, 1000, 0),
+                     GlyphData(2, 1, 1000, 0)]),
+        ShapeResult(),
+        ShapeResult([GlyphData(3, 0, 1000, -20)]),
+    ]
+
+    shaper = HbShapeShaper(horizontal_font.vertical_font)
+    results = await shaper.shape_many(texts)
+    assert results[2] == ShapeResult([GlyphData(3, 0, 1000, 880)])
+
+
+@pytest.mark.asyncio
+async def test_shape_many(test_font_path):
+    font = Font.load(test_font_path)
+    shaper = UHarfBuzzShaper(font, features=['fwid'])
+    texts = ('\uFF08\uFF09', '', '\u30FB\u56DB')
+    expected = [await shaper.shape(text) for text in texts]
+    assert len(expected[0]) == 2
+    assert await shaper.shape_many(texts) == expected
+    # The default implementation of `ShaperBase` shapes one by one.
+    assert await ShaperBase.shape_many(shaper, texts) == expected
+
+
 @pytest.mark.asyncio
 async def test_glyph_data_set(test_font_path):
     font = Font.load(test_font_path)
@@ -39,3 +39,12 @@ def test_glyph_sets_instance():
     assert len(gs2.right) == 0
     assert len(gs2.middle) == 0
     assert len(gs2.space) == 0
+
+
+def test_has_any_code_points(test_font_path):
+    font = Font.load(test_font_path)
+    config = Config.default
+    assert GlyphSets.has_any_code_points(font, config)
+    config = config.clone()
+    config.clear()
+    assert not GlyphSets.has_any_code_points(font, config)
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from east_asian_spacing import EastAsianSpacingTester
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", [None, 1, 2])
+async def test_run_coros(limit):
+    num_created = 0
+    num_completed = 0
+
+    async def run(value):
+        nonlocal num_completed
+        # Complete in the reverse order.
+        await asyncio.sleep((5 - value) / 1000)
+        num_completed += 1
+        return value
+
+    def coros():
+        nonlocal num_created
+        for value in range(5):
+            # `coros` should be read only when a worker is available.
+            if limit:
+                assert num_created - num_completed < limit
+            num_created += 1
+            yield run(value)
+
+    results = await EastAsianSpacingTester.run_coros(coros(), limit=limit)
+    assert results == list(range(5))
+
+
+@pytest.mark.asyncio
+async def test_run_coros_not_parallel():
+    num_running = 0
+
+    async def run(value):
+        nonlocal num_running
+        num_running += 1
+        assert num_running == 1
+        await asyncio.sleep(0)
+        num_running -= 1
+        return value
+
+    coros = (run(value) for value in range(3))
+    results = await EastAsianSpacingTester.run_coros(coros, parallel=False)
+    assert results == list(range(3))